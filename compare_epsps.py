@@ -18,33 +18,34 @@ import matplotlib.pyplot as plt
 def fast_epsp(t, A1=150, tau_rise1=0.01, tau_decay1=1.0, A2=70, tau_rise2=3.0, tau_decay2=20.0):
     """
     Parameters:
-    t: time in seconds
+    t: time in seconds (must be non-negative)
     A1, A2: amplitudes in pA
     tau_rise1, tau_decay1, tau_rise2, tau_decay2: time constants in seconds
     """
-    component1 = A1 * (1 - np.exp(-t / tau_rise1)) * np.exp(-t / tau_decay1)
-    component2 = A2 * (1 - np.exp(-t / tau_rise2)) * np.exp(-t / tau_decay2)
+    inv_decay1 = 1.0 / tau_decay1
+    inv_decay2 = 1.0 / tau_decay2
+    component1 = A1 * (np.exp(t * -inv_decay1) - np.exp(t * -(1.0 / tau_rise1 + inv_decay1)))
+    component2 = A2 * (np.exp(t * -inv_decay2) - np.exp(t * -(1.0 / tau_rise2 + inv_decay2)))
     y = component1 + component2
-    y[t < 0] = 0
     return y
 
 # Slow-rising (single exponential)
 def slow_epsp(t, A=150, tau_rise=10.0, tau_decay=15.0):
     """
     Parameters:
-    t: time in seconds
+    t: time in seconds (must be non-negative)
     A: amplitude in pA
     tau_rise, tau_decay: time constants in seconds
     """
-    y = A * (1 - np.exp(-t / tau_rise)) * np.exp(-t / tau_decay)
-    y[t < 0] = 0
+    inv_decay = 1.0 / tau_decay
+    y = A * (np.exp(t * -inv_decay) - np.exp(t * -(1.0 / tau_rise + inv_decay)))
     return y
 
 # Generate time arrays (in seconds)
 sampling_rate = 20000  # Hz (20 kHz)
 dt = 1.0 / sampling_rate  # seconds
 duration = 0.100  # seconds (100 ms)
-time = np.arange(0, duration, dt)
+time = np.arange(0, duration, dt, dtype=np.float32)  # float32 is ample for plotting
 
 # Parameters in milliseconds (as used in the paper)
 A1_pA = 150
@@ -77,22 +78,24 @@ ax1.set_xlabel('Time (s)', fontsize=11)
 ax1.set_ylabel('Current (pA)', fontsize=11)
 ax1.set_title('Fast-Rising EPSP (Double Exponential)', fontsize=12, fontweight='bold')
 ax1.grid(True, alpha=0.3)
-peak_idx = np.argmax(current_fast)
-ax1.plot(time[peak_idx], current_fast[peak_idx], 'ro', markersize=8)
-ax1.text(0.98, 0.95, f'Peak: {current_fast[peak_idx]:.1f} pA\n@ {time[peak_idx]:.6f} s',
+peak_idx = int(np.argmax(current_fast))
+peak_t, peak_y = time[peak_idx], current_fast[peak_idx]
+ax1.plot(peak_t, peak_y, 'ro', markersize=8)
+ax1.text(0.98, 0.95, f'Peak: {peak_y:.1f} pA\n@ {peak_t:.6f} s',
          transform=ax1.transAxes, fontsize=9, va='top', ha='right',
          bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.7))
 
 # Fast-rising - zoomed (0-0.01 s = 0-10 ms)
 zoom_time = 0.01  # 10 ms in seconds
-ax2.plot(time[time <= zoom_time], current_fast[time <= zoom_time], 'b-', linewidth=2)
+k_zoom = np.searchsorted(time, zoom_time, side='right')  # time is ascending
+ax2.plot(time[:k_zoom], current_fast[:k_zoom], 'b-', linewidth=2)
 ax2.axhline(y=0, color='k', linestyle='--', alpha=0.3)
 ax2.set_xlabel('Time (s)', fontsize=11)
 ax2.set_ylabel('Current (pA)', fontsize=11)
 ax2.set_title(f'Fast-Rising - Zoomed (0-{zoom_time*1000:.0f} ms)', fontsize=12, fontweight='bold')
 ax2.grid(True, alpha=0.3)
-if time[peak_idx] <= zoom_time:
-    ax2.plot(time[peak_idx], current_fast[peak_idx], 'ro', markersize=8)
+if peak_t <= zoom_time:
+    ax2.plot(peak_t, peak_y, 'ro', markersize=8)
 
 # Slow-rising - full
 ax3.plot(time, current_slow, 'g-', linewidth=2, label='Slow-rising')
@@ -101,9 +104,10 @@ ax3.set_xlabel('Time (s)', fontsize=11)
 ax3.set_ylabel('Current (pA)', fontsize=11)
 ax3.set_title('Slow-Rising EPSP (Single Exponential)', fontsize=12, fontweight='bold')
 ax3.grid(True, alpha=0.3)
-peak_idx_slow = np.argmax(current_slow)
-ax3.plot(time[peak_idx_slow], current_slow[peak_idx_slow], 'ro', markersize=8)
-ax3.text(0.98, 0.95, f'Peak: {current_slow[peak_idx_slow]:.1f} pA\n@ {time[peak_idx_slow]:.6f} s',
+peak_idx_slow = int(np.argmax(current_slow))
+peak_t_slow, peak_y_slow = time[peak_idx_slow], current_slow[peak_idx_slow]
+ax3.plot(peak_t_slow, peak_y_slow, 'ro', markersize=8)
+ax3.text(0.98, 0.95, f'Peak: {peak_y_slow:.1f} pA\n@ {peak_t_slow:.6f} s',
          transform=ax3.transAxes, fontsize=9, va='top', ha='right',
          bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.7))
 
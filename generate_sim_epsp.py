@@ -36,10 +36,12 @@ See page 5 of the Clampex stimulus file tutorial for more details.
 
 import numpy as np
 import argparse
-import matplotlib
-# matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
+import functools
+import json
+import locale
+import math
 import os
+import sys
 
 
 def generate_filename(kinetics, sampling_rate, delay=None, A1=None, A2=None, A=None,
@@ -70,6 +72,90 @@ def generate_filename(kinetics, sampling_rate, delay=None, A1=None, A2=None, A=N
     return base
 
 
+# Below this many samples, or on a single core, the vectorized float32 NumPy path
+# is faster than the multi-threaded backends, whose import and dispatch cost dominates
+_PARALLEL_MIN_SAMPLES = 100_000
+
+
+def _use_parallel(n):
+    """Return True if n samples are worth handing to a multi-threaded backend."""
+    return n >= _PARALLEL_MIN_SAMPLES and (os.cpu_count() or 1) > 1
+
+
+@functools.lru_cache(maxsize=None)
+def _numba_kernels():
+    """
+    Return the Numba kernels (double, single), compiling them on first use,
+    or None if Numba is not installed.
+
+    Numba is imported here rather than at module level: the import alone costs
+    more than the rest of the script's start-up.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:  # Numba is optional; the NumPy implementation is used instead
+        return None
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def double_exponential_kernel(t, A1, inv_decay1, k1, A2, inv_decay2, k2, out):
+        """
+        Fused, multi-threaded evaluation of the double-exponential waveform.
+
+        Computes A1*(exp(-t*inv_decay1) - exp(-t*k1)) + A2*(exp(-t*inv_decay2) - exp(-t*k2))
+        in a single pass over t, writing into the preallocated out array.
+        """
+        for i in prange(t.shape[0]):
+            ti = t[i]
+            out[i] = (A1 * (math.exp(-ti * inv_decay1) - math.exp(-ti * k1))
+                      + A2 * (math.exp(-ti * inv_decay2) - math.exp(-ti * k2)))
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def single_exponential_kernel(t, A, inv_decay, k, out):
+        """
+        Fused, multi-threaded evaluation of the single-exponential waveform.
+
+        Computes A*(exp(-t*inv_decay) - exp(-t*k)) in a single pass over t,
+        writing into the preallocated out array.
+        """
+        for i in prange(t.shape[0]):
+            ti = t[i]
+            out[i] = A * (math.exp(-ti * inv_decay) - math.exp(-ti * k))
+
+    return double_exponential_kernel, single_exponential_kernel
+
+
+@functools.lru_cache(maxsize=None)
+def _numexpr():
+    """
+    Return the numexpr module, importing it on first use, or None if it is not
+    installed.
+    """
+    try:
+        import numexpr
+    except ImportError:  # numexpr is optional; the NumPy implementation is used instead
+        return None
+    return numexpr
+
+
+def _split_onset(t, n_rows=None):
+    """
+    Prepare the output array for a waveform that is zero before stimulus onset.
+
+    Returns (t, y, start) where t is a floating-point ndarray, y is an array like t
+    (or of shape (n_rows, len(t)) if n_rows is given) with the pre-onset samples
+    (t < 0) already set to zero, and start is the index of the first sample at or
+    after onset. t must be in ascending order, so the pre-onset samples form a prefix.
+    """
+    t = np.asarray(t)
+    if t.dtype.kind != 'f':
+        t = t.astype(np.float64)
+    shape = t.shape if n_rows is None else (n_rows, t.size)
+    y = np.empty(shape, dtype=t.dtype)
+    start = np.searchsorted(t, 0)
+    y[..., :start] = 0
+    return t, y, start
+
+
 def double_exponential(t, A1, tau_rise1, tau_decay1, A2, tau_rise2, tau_decay2):
     """
     Calculate the double-exponential sim-EPSP current (FAST-RISING).
@@ -77,7 +163,7 @@ def double_exponential(t, A1, tau_rise1, tau_decay1, A2, tau_rise2, tau_decay2):
     Parameters:
     -----------
     t : array-like
-        Time values in seconds
+        Time values in seconds, in ascending order
     A1 : float
         Amplitude of first component (pA)
     tau_rise1 : float
@@ -96,17 +182,59 @@ def double_exponential(t, A1, tau_rise1, tau_decay1, A2, tau_rise2, tau_decay2):
     y : array-like
         Current amplitude at each time point (pA)
     """
-    # First component (fast)
-    component1 = A1 * (1 - np.exp(-t / tau_rise1)) * np.exp(-t / tau_decay1)
+    # Each component uses the identity
+    #   (1 - exp(-t/τrise)) * exp(-t/τdecay) = exp(-t/τdecay) - exp(-t*(1/τrise + 1/τdecay))
+    # so only two exp() evaluations are needed per component
+    inv_rise1 = 1.0 / tau_rise1
+    inv_decay1 = 1.0 / tau_decay1
+    inv_rise2 = 1.0 / tau_rise2
+    inv_decay2 = 1.0 / tau_decay2
+
+    # Negative time values are the delay period and stay at zero
+    t, y, start = _split_onset(t)
+    t_post = t[start:]
+    if t_post.size == 0:
+        return y
 
-    # Second component (slow)
-    component2 = A2 * (1 - np.exp(-t / tau_rise2)) * np.exp(-t / tau_decay2)
+    if _use_parallel(t_post.size) and _numba_kernels() is not None:
+        # Numba path: one fused pass; parameters are cast to the array dtype
+        # so float32 input stays float32
+        kernel = _numba_kernels()[0]
+        cast = t.dtype.type
+        kernel(
+            t_post, cast(A1), cast(inv_decay1), cast(inv_rise1 + inv_decay1),
+            cast(A2), cast(inv_decay2), cast(inv_rise2 + inv_decay2), y[start:]
+        )
+    elif _use_parallel(t_post.size) and _numexpr() is not None:
+        # numexpr path: fused, multi-threaded and cache-blocked evaluation
+        ne = _numexpr()
+        cast = t.dtype.type
+        ne.evaluate("A1 * (exp(-t * d1) - exp(-t * k1)) + A2 * (exp(-t * d2) - exp(-t * k2))",
+                    local_dict={'t': t_post, 'A1': cast(A1), 'd1': cast(inv_decay1),
+                                'k1': cast(inv_rise1 + inv_decay1), 'A2': cast(A2),
+                                'd2': cast(inv_decay2), 'k2': cast(inv_rise2 + inv_decay2)},
+                    out=y[start:])
+    else:
+        # NumPy path: ufuncs write into the output slice and two scratch arrays
+        # (out=) instead of allocating a temporary for every intermediate
+        y_post = y[start:]
+        s1 = np.empty_like(t_post)
+        s2 = np.empty_like(t_post)
 
-    # Total current
-    y = component1 + component2
+        # First component (fast)
+        np.exp(np.multiply(t_post, -inv_decay1, out=y_post), out=y_post)
+        np.exp(np.multiply(t_post, -(inv_rise1 + inv_decay1), out=s1), out=s1)
+        y_post -= s1
+        y_post *= A1
 
-    # Set negative time values to zero (handles delay period)
-    y[t < 0] = 0
+        # Second component (slow)
+        np.exp(np.multiply(t_post, -inv_decay2, out=s1), out=s1)
+        np.exp(np.multiply(t_post, -(inv_rise2 + inv_decay2), out=s2), out=s2)
+        s1 -= s2
+        s1 *= A2
+
+        # Total current
+        y_post += s1
 
     return y
 
@@ -118,7 +246,7 @@ def single_exponential(t, A, tau_rise, tau_decay):
     Parameters:
     -----------
     t : array-like
-        Time values in seconds
+        Time values in seconds, in ascending order
     A : float
         Amplitude (pA)
     tau_rise : float
@@ -131,15 +259,123 @@ def single_exponential(t, A, tau_rise, tau_decay):
     y : array-like
         Current amplitude at each time point (pA)
     """
-    # Single exponential rise and decay
-    y = A * (1 - np.exp(-t / tau_rise)) * np.exp(-t / tau_decay)
+    # Single exponential rise and decay, written as a difference of exponentials
+    # (see double_exponential) to avoid the separate rise/decay products
+    inv_rise = 1.0 / tau_rise
+    inv_decay = 1.0 / tau_decay
+
+    # Negative time values are the delay period and stay at zero
+    t, y, start = _split_onset(t)
+    t_post = t[start:]
+    if t_post.size == 0:
+        return y
 
-    # Set negative time values to zero (handles delay period)
-    y[t < 0] = 0
+    if _use_parallel(t_post.size) and _numba_kernels() is not None:
+        # Numba path: one fused pass; parameters are cast to the array dtype
+        # so float32 input stays float32
+        kernel = _numba_kernels()[1]
+        cast = t.dtype.type
+        kernel(t_post, cast(A), cast(inv_decay), cast(inv_rise + inv_decay), y[start:])
+    elif _use_parallel(t_post.size) and _numexpr() is not None:
+        # numexpr path: fused, multi-threaded and cache-blocked evaluation
+        ne = _numexpr()
+        cast = t.dtype.type
+        ne.evaluate("A * (exp(-t * d) - exp(-t * k))",
+                    local_dict={'t': t_post, 'A': cast(A), 'd': cast(inv_decay),
+                                'k': cast(inv_rise + inv_decay)},
+                    out=y[start:])
+    else:
+        # NumPy path: ufuncs write into the output slice and one scratch array
+        y_post = y[start:]
+        s1 = np.empty_like(t_post)
+        np.exp(np.multiply(t_post, -inv_decay, out=y_post), out=y_post)
+        np.exp(np.multiply(t_post, -(inv_rise + inv_decay), out=s1), out=s1)
+        y_post -= s1
+        y_post *= A
 
     return y
 
 
+def _param_columns(t, *params):
+    """
+    Broadcast scalar or 1-D parameter values against each other and return them
+    as (P, 1) columns in the dtype of t, ready to broadcast against a time row.
+    """
+    params = np.broadcast_arrays(*[np.atleast_1d(np.asarray(p, dtype=t.dtype)) for p in params])
+    return [p.reshape(-1, 1) for p in params]
+
+
+def batch_double_exponential(t, A1, tau_rise1, tau_decay1, A2, tau_rise2, tau_decay2):
+    """
+    Calculate many double-exponential sim-EPSP currents at once (FAST-RISING).
+
+    Each parameter may be a scalar or a 1-D array of length P; all are broadcast
+    together and evaluated against t in a single vectorized pass, which is much
+    cheaper than calling double_exponential P times for a parameter sweep.
+
+    Parameters:
+    -----------
+    t : array-like
+        Time values in seconds, in ascending order (length N)
+    A1, tau_rise1, tau_decay1, A2, tau_rise2, tau_decay2 : float or array-like
+        As for double_exponential (amplitudes in pA, time constants in s)
+
+    Returns:
+    --------
+    y : ndarray
+        Current amplitude (pA), shape (P, N) with one row per parameter set
+    """
+    t = np.asarray(t)
+    if t.dtype.kind != 'f':
+        t = t.astype(np.float64)
+    A1, tau_rise1, tau_decay1, A2, tau_rise2, tau_decay2 = _param_columns(
+        t, A1, tau_rise1, tau_decay1, A2, tau_rise2, tau_decay2)
+    inv_decay1 = 1 / tau_decay1
+    inv_decay2 = 1 / tau_decay2
+    k1 = 1 / tau_rise1 + inv_decay1
+    k2 = 1 / tau_rise2 + inv_decay2
+
+    # Negative time values are the delay period and stay at zero
+    t, y, start = _split_onset(t, n_rows=A1.shape[0])
+    t_post = t[start:]
+    y[:, start:] = (A1 * (np.exp(t_post * -inv_decay1) - np.exp(t_post * -k1))
+                    + A2 * (np.exp(t_post * -inv_decay2) - np.exp(t_post * -k2)))
+    return y
+
+
+def batch_single_exponential(t, A, tau_rise, tau_decay):
+    """
+    Calculate many single-exponential sim-EPSP currents at once (SLOW-RISING).
+
+    Each parameter may be a scalar or a 1-D array of length P; see
+    batch_double_exponential.
+
+    Parameters:
+    -----------
+    t : array-like
+        Time values in seconds, in ascending order (length N)
+    A, tau_rise, tau_decay : float or array-like
+        As for single_exponential (amplitude in pA, time constants in s)
+
+    Returns:
+    --------
+    y : ndarray
+        Current amplitude (pA), shape (P, N) with one row per parameter set
+    """
+    t = np.asarray(t)
+    if t.dtype.kind != 'f':
+        t = t.astype(np.float64)
+    A, tau_rise, tau_decay = _param_columns(t, A, tau_rise, tau_decay)
+    inv_decay = 1 / tau_decay
+    k = 1 / tau_rise + inv_decay
+
+    # Negative time values are the delay period and stay at zero
+    t, y, start = _split_onset(t, n_rows=A.shape[0])
+    t_post = t[start:]
+    y[:, start:] = A * (np.exp(t_post * -inv_decay) - np.exp(t_post * -k))
+    return y
+
+
 def generate_time_array(duration=1000.0, dt_fine=0.01, dt_coarse=1.0, 
                         fine_duration=10.0):
     """
@@ -161,14 +397,25 @@ def generate_time_array(duration=1000.0, dt_fine=0.01, dt_coarse=1.0,
     t : ndarray
         Time array (ms)
     """
-    # Fine resolution for the initial period (critical dynamics)
-    t_fine = np.arange(0, fine_duration, dt_fine)
-    
-    # Coarse resolution for the remainder
-    t_coarse = np.arange(fine_duration, duration + dt_coarse, dt_coarse)
-    
-    # Combine and ensure unique values
-    t = np.unique(np.concatenate([t_fine, t_coarse]))
+    # Sample counts, as np.arange(0, fine_duration, dt_fine) and
+    # np.arange(fine_duration, duration + dt_coarse, dt_coarse) would give
+    n_fine = max(int(np.ceil(fine_duration / dt_fine)), 0)
+    n_coarse = max(int(np.ceil((duration + dt_coarse - fine_duration) / dt_coarse)), 0)
+
+    # Fill both segments into a single preallocated array: no concatenate, no sort
+    t = np.empty(n_fine + n_coarse)
+    t_fine = t[:n_fine]
+    t_fine[:] = np.arange(n_fine)
+    t_fine *= dt_fine  # fine resolution for the initial period (critical dynamics)
+    t_coarse = t[n_fine:]
+    t_coarse[:] = np.arange(n_coarse)
+    t_coarse *= dt_coarse  # coarse resolution for the remainder
+    t_coarse += fine_duration
+
+    # Rounding can put the last fine sample on (or past) the first coarse one;
+    # only then is a sort and deduplication needed
+    if n_fine and n_coarse and t[n_fine - 1] >= t[n_fine]:
+        t = np.unique(t)
     
     return t
 
@@ -204,60 +451,178 @@ def write_atf_file(filename, time, current, comment="Simulated EPSP",
     delay : float, optional
         Delay before stimulus (s)
     """
-    with open(filename, 'w') as f:
-        # ATF header
-        f.write("ATF\t1.0\n")
-        f.write("8\t2\n")
-        f.write('"AcquisitionMode=Episodic Stimulation"\n')
-
-        # Build detailed comment with all parameters
-        detailed_comment = comment
-        if kinetics == 'fast' and all(p is not None for p in [A1, A2, tau_rise1, tau_decay1, tau_rise2, tau_decay2]):
-            detailed_comment += (f" | A1={A1}pA A2={A2}pA "
-                                f"tau_rise1={tau_rise1}ms tau_decay1={tau_decay1}ms "
-                                f"tau_rise2={tau_rise2}ms tau_decay2={tau_decay2}ms")
-        elif kinetics == 'slow' and all(p is not None for p in [A, tau_rise, tau_decay]):
-            detailed_comment += (f" | A={A}pA "
-                                f"tau_rise={tau_rise}ms tau_decay={tau_decay}ms")
-        if delay is not None:
-            detailed_comment += f" | delay={delay*1000}ms"
-        if sampling_rate is not None:
-            detailed_comment += f" | sampling_rate={sampling_rate}Hz"
-
-        f.write(f'"Comment={detailed_comment}"\n')
-        
-        # Calculate Y-axis range for display
-        y_max = np.max(current)
-        y_min = np.min(current)
-        y_range = y_max - y_min
-        y_top = y_max + 0.1 * y_range
-        y_bottom = y_min - 0.1 * y_range
-        
-        f.write(f'"YTop={y_top:.2f}"\n')
-        f.write(f'"YBottom={y_bottom:.2f}"\n')
-        # in example from clampex, unsure of meaning
-        # f.write('"SyncTimeUnits=5"\n')
-        f.write('"SweepStartTimesMS=0.000"\n')
-        f.write('"SignalsExported=IN 0"\n')
-        f.write('"Signals="\t"IN 0"\n')
-        
+    # Build detailed comment with all parameters
+    detailed_comment = comment
+    if kinetics == 'fast' and all(p is not None for p in [A1, A2, tau_rise1, tau_decay1, tau_rise2, tau_decay2]):
+        detailed_comment += (f" | A1={A1}pA A2={A2}pA "
+                            f"tau_rise1={tau_rise1}ms tau_decay1={tau_decay1}ms "
+                            f"tau_rise2={tau_rise2}ms tau_decay2={tau_decay2}ms")
+    elif kinetics == 'slow' and all(p is not None for p in [A, tau_rise, tau_decay]):
+        detailed_comment += (f" | A={A}pA "
+                            f"tau_rise={tau_rise}ms tau_decay={tau_decay}ms")
+    if delay is not None:
+        detailed_comment += f" | delay={delay*1000}ms"
+    if sampling_rate is not None:
+        detailed_comment += f" | sampling_rate={sampling_rate}Hz"
+
+    # Calculate Y-axis range for display (the peak index is reused in the summary)
+    peak_idx = int(np.argmax(current))
+    y_max = current[peak_idx]
+    y_min = np.min(current)
+    y_range = y_max - y_min
+    y_top = y_max + 0.1 * y_range
+    y_bottom = y_min - 0.1 * y_range
+
+    # ATF header, written in one call.
+    # "SyncTimeUnits=5" appears in examples from Clampex but is omitted (unsure of meaning)
+    header = (
+        "ATF\t1.0\n"
+        "8\t2\n"
+        '"AcquisitionMode=Episodic Stimulation"\n'
+        f'"Comment={detailed_comment}"\n'
+        f'"YTop={y_top:.2f}"\n'
+        f'"YBottom={y_bottom:.2f}"\n'
+        '"SweepStartTimesMS=0.000"\n'
+        '"SignalsExported=IN 0"\n'
+        '"Signals="\t"IN 0"\n'
         # Column headers
-        f.write('"Time (s)"\t"IN 0 (pA)"\n')
-        
-        # Data - use general format 'g' for automatic scientific notation when needed
-        for t_val, i_val in zip(time, current):
-            f.write(f"{t_val:g}\t{i_val:g}\n")
-    
+        '"Time (s)"\t"IN 0 (pA)"\n'
+    )
+
+    # Data - use general format 'g' for automatic scientific notation when needed.
+    # The whole block is formatted with a single %-operation, which runs the
+    # per-value formatting loop in C (several times faster than np.savetxt).
+    data = np.column_stack([time, current])
+    text = header + ('%g\t%g\n' * len(data)) % tuple(data.ravel().tolist())
+
+    # Write the file in one binary call, bypassing the text I/O layer. Line endings
+    # and encoding are converted here to match what text mode would have written.
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    with open(filename, 'wb') as f:
+        f.write(text.encode(locale.getpreferredencoding(False)))
+
     print(f"ATF file written successfully: {filename}")
     print(f"Duration: {time[-1]:.6f} s")
     print(f"Number of points: {len(time)}")
-    print(f"Peak current: {np.max(current):.4f} pA at {time[np.argmax(current)]:.6f} s")
+    print(f"Peak current: {y_max:.4f} pA at {time[peak_idx]:.6f} s")
+
+
+def write_h5_file(filename, time, current, comment="Simulated EPSP",
+                  kinetics=None, A1=None, A2=None, A=None,
+                  tau_rise1=None, tau_rise2=None, tau_rise=None,
+                  tau_decay1=None, tau_decay2=None, tau_decay=None,
+                  sampling_rate=None, delay=None):
+    """
+    Write data to an HDF5 file (requires h5py).
+
+    Much faster to write and smaller on disk than ATF, for traces that are
+    analysed in Python rather than played back in Clampex. Time and current
+    are stored as LZF-compressed datasets 't' (s) and 'i' (pA); the comment
+    and all provided parameters are stored as file attributes.
+
+    Parameters are the same as for write_atf_file.
+    """
+    import h5py
+
+    params = dict(kinetics=kinetics, A1=A1, A2=A2, A=A,
+                  tau_rise1=tau_rise1, tau_rise2=tau_rise2, tau_rise=tau_rise,
+                  tau_decay1=tau_decay1, tau_decay2=tau_decay2, tau_decay=tau_decay,
+                  sampling_rate=sampling_rate, delay=delay)
+
+    with h5py.File(filename, 'w') as h:
+        h.create_dataset('t', data=time, compression='lzf')
+        h.create_dataset('i', data=current, compression='lzf')
+        h.attrs['comment'] = comment
+        for name, value in params.items():
+            if value is not None:
+                h.attrs[name] = value
+
+    print(f"HDF5 file written successfully: {filename}")
+    print(f"Duration: {time[-1]:.6f} s")
+    print(f"Number of points: {len(time)}")
+    peak_idx = int(np.argmax(current))
+    print(f"Peak current: {current[peak_idx]:.4f} pA at {time[peak_idx]:.6f} s")
+
+
+def write_trace(filename, time, current, fmt='atf', **kwargs):
+    """
+    Write a stimulus trace in the requested output format.
+
+    Parameters:
+    -----------
+    filename : str
+        Output filename
+    time : array-like
+        Time values (s)
+    current : array-like
+        Current values (pA)
+    fmt : str
+        'atf' (Clampex stimulus file) or 'h5' (HDF5, requires h5py)
+    **kwargs
+        Comment and parameters passed on to write_atf_file / write_h5_file
+    """
+    if fmt == 'atf':
+        write_atf_file(filename, time, current, **kwargs)
+    elif fmt == 'h5':
+        write_h5_file(filename, time, current, **kwargs)
+    else:
+        raise ValueError(f"Unknown output format: {fmt}")
+
+
+def downsample_for_plot(time, current, n_out=4000):
+    """
+    Reduce a long trace to at most n_out points for plotting.
+
+    Uses Largest-Triangle-Three-Buckets (LTTB) downsampling from the optional
+    tsdownsample package, which keeps the visual shape of the trace (including
+    the peak) at a fraction of the rendering cost. Without tsdownsample, the
+    minimum and maximum of each of n_out/2 equal buckets are kept instead, which
+    also preserves the peak (unlike plain striding). Traces of n_out points or
+    fewer are returned unchanged.
+
+    Parameters:
+    -----------
+    time : array-like
+        Time values (s), in ascending order
+    current : array-like
+        Current values (pA)
+    n_out : int
+        Maximum number of points to keep
+
+    Returns:
+    --------
+    time, current : array-like
+        The (possibly downsampled) trace
+    """
+    if len(time) <= n_out:
+        return time, current
+    try:
+        from tsdownsample import LTTBDownsampler
+    except ImportError:  # tsdownsample is optional; fall back to min/max buckets
+        LTTBDownsampler = None
+
+    if LTTBDownsampler is not None:
+        idx = LTTBDownsampler().downsample(time, current, n_out=n_out)
+    else:
+        # Index of the min and max sample in each bucket; the last bucket may be short
+        current = np.asarray(current)
+        size = -(-len(current) // (n_out // 2))  # ceil
+        n_full = len(current) // size * size
+        blocks = current[:n_full].reshape(-1, size)
+        offsets = np.arange(blocks.shape[0]) * size
+        idx = [offsets + blocks.argmin(axis=1), offsets + blocks.argmax(axis=1)]
+        if n_full < len(current):
+            tail = current[n_full:]
+            idx.append([n_full + tail.argmin(), n_full + tail.argmax()])
+        idx = np.unique(np.concatenate(idx))
+    return time[idx], current[idx]
 
 
 def plot_stimulus(time, current, output_filename, title="Simulated EPSP Stimulus", 
                   A1=None, tau_rise1=None, tau_decay1=None, 
                   A2=None, tau_rise2=None, tau_decay2=None,
-                  A=None, tau_rise=None, tau_decay=None):
+                  A=None, tau_rise=None, tau_decay=None, dpi=120):
     """
     Create and save a plot of the stimulus waveform.
     
@@ -275,11 +640,33 @@ def plot_stimulus(time, current, output_filename, title="Simulated EPSP Stimulus
         Parameters for fast-rising (double exponential) to display in the plot
     A, tau_rise, tau_decay : float, optional
         Parameters for slow-rising (single exponential) to display in the plot
+    dpi : float
+        Resolution of the saved image (dots per inch)
     """
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), height_ratios=[2, 1])
-    
+    # Imported here so that ATF generation with --no_plot does not pay for matplotlib.
+    # A bare Figure renders with the non-interactive Agg canvas on savefig, without
+    # importing pyplot or changing the backend of an interactive session.
+    from matplotlib.figure import Figure
+
+    # Locate peak
+    peak_idx = np.argmax(current)
+    peak_time = time[peak_idx]
+    peak_current = current[peak_idx]
+
+    # Zoomed view covers the early time course (first 0.01 s or 10% of duration,
+    # whichever is larger). It is only drawn when the peak falls inside it;
+    # otherwise it would show nothing but baseline.
+    zoom_duration = max(0.01, time[-1] * 0.1)
+    needs_zoom = peak_time <= zoom_duration
+    if needs_zoom:
+        fig = Figure(figsize=(12, 8))
+        ax1, ax2 = fig.subplots(2, 1, height_ratios=[2, 1])
+    else:
+        fig = Figure(figsize=(12, 16 / 3))
+        ax1 = fig.subplots(1, 1)
+
     # Main plot - full time course
-    ax1.plot(time, current, 'b-', linewidth=1.5)
+    ax1.plot(*downsample_for_plot(time, current), 'b-', linewidth=1.5)
     ax1.axhline(y=0, color='k', linestyle='--', alpha=0.3, linewidth=1)
     ax1.set_xlabel('Time (s)', fontsize=12)
     ax1.set_ylabel('Current (pA)', fontsize=12)
@@ -289,9 +676,6 @@ def plot_stimulus(time, current, output_filename, title="Simulated EPSP Stimulus
     ax1.spines['right'].set_visible(False)
     
     # Mark peak
-    peak_idx = np.argmax(current)
-    peak_time = time[peak_idx]
-    peak_current = current[peak_idx]
     ax1.plot(peak_time, peak_current, 'ro', markersize=8, label=f'Peak: {peak_current:.1f} pA @ {peak_time:.6f} s')
     ax1.legend(loc='upper right', fontsize=10)
     
@@ -318,29 +702,189 @@ def plot_stimulus(time, current, output_filename, title="Simulated EPSP Stimulus
                 fontsize=9, verticalalignment='bottom', horizontalalignment='right',
                 bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.5))
     
-    # Zoomed plot - early time course (first 0.01 s or 10% of duration, whichever is larger)
-    zoom_duration = max(0.01, time[-1] * 0.1)
-    zoom_mask = time <= zoom_duration
-    ax2.plot(time[zoom_mask], current[zoom_mask], 'b-', linewidth=1.5)
-    ax2.axhline(y=0, color='k', linestyle='--', alpha=0.3, linewidth=1)
-    ax2.set_xlabel('Time (s)', fontsize=12)
-    ax2.set_ylabel('Current (pA)', fontsize=12)
-    ax2.set_title(f'Zoomed View (0-{zoom_duration:.4f} s)', fontsize=12, fontweight='bold')
-    ax2.grid(True, alpha=0.3)
-    ax2.spines['top'].set_visible(False)
-    ax2.spines['right'].set_visible(False)
-    
-    # Mark peak on zoomed plot if within range
-    if peak_time <= zoom_duration:
+    # Zoomed plot - early time course, with the peak marked
+    if needs_zoom:
+        k_zoom = np.searchsorted(time, zoom_duration, side='right')  # time is ascending
+        ax2.plot(*downsample_for_plot(time[:k_zoom], current[:k_zoom]), 'b-', linewidth=1.5)
+        ax2.axhline(y=0, color='k', linestyle='--', alpha=0.3, linewidth=1)
+        ax2.set_xlabel('Time (s)', fontsize=12)
+        ax2.set_ylabel('Current (pA)', fontsize=12)
+        ax2.set_title(f'Zoomed View (0-{zoom_duration:.4f} s)', fontsize=12, fontweight='bold')
+        ax2.grid(True, alpha=0.3)
+        ax2.spines['top'].set_visible(False)
+        ax2.spines['right'].set_visible(False)
         ax2.plot(peak_time, peak_current, 'ro', markersize=8)
     
-    plt.tight_layout()
-    plt.savefig(output_filename, dpi=300, bbox_inches='tight')
-    plt.close()
+    # Layout is fixed once by tight_layout; bbox_inches='tight' would render the figure twice
+    fig.tight_layout()
+    fig.savefig(output_filename, dpi=dpi)
     
     print(f"Plot saved: {output_filename}")
 
 
+def precompute_time(args):
+    """
+    Build the time base (delay + stimulus) described by the command-line arguments.
+
+    Parameters:
+    -----------
+    args : argparse.Namespace
+        Parsed command-line arguments (sampling and delay options)
+
+    Returns:
+    --------
+    time : ndarray
+        Time values (s), starting at 0 and including the delay period
+    delay : float
+        Delay before stimulus onset (s)
+    """
+    if args.uniform_sampling:
+        # Uniform sampling interval (better for Clampex protocol setup)
+        dt = 1.0 / args.sampling_rate  # Sampling rate in Hz, dt in seconds
+
+        # Calculate delay
+        if args.auto_delay:
+            # Total sweep includes delay + stimulus duration
+            total_samples = int((args.delay + args.duration) / dt)
+            delay = (total_samples / 64) * dt
+            print(f"Auto-calculated delay: {delay:.6f} s ({delay*1000:.3f} ms)")
+        else:
+            delay = args.delay
+            print(f"Using specified delay: {delay:.6f} s ({delay*1000:.3f} ms)")
+
+        # Generate full time array (delay + stimulus)
+        total_duration = delay + args.duration
+        time = np.arange(0, total_duration, dt)
+        print(f"Using uniform sampling: {args.sampling_rate} Hz ({dt:.6f} s interval)")
+        print(f"Total duration: {total_duration:.6f} s (delay: {delay*1000:.3f} ms + stimulus: {args.duration*1000:.3f} ms)")
+    else:
+        # Variable resolution sampling (function generates time in ms, convert to s)
+        duration_ms = args.duration * 1000  # Convert duration from s to ms
+        time_ms = generate_time_array(
+            duration=duration_ms,
+            dt_fine=args.dt_fine,
+            dt_coarse=args.dt_coarse,
+            fine_duration=args.fine_duration
+        )
+        # Convert time from ms to seconds
+        time = time_ms / 1000
+
+        # Calculate delay for variable sampling
+        if args.auto_delay:
+            dt_avg = time[1] - time[0]  # Approximate dt
+            total_samples = len(time)
+            delay = (total_samples / 64) * dt_avg
+            print(f"Auto-calculated delay: {delay:.6f} s ({delay*1000:.3f} ms)")
+        else:
+            delay = args.delay
+            print(f"Using specified delay: {delay:.6f} s ({delay*1000:.3f} ms)")
+
+        # Add delay by prepending time points
+        delay_samples = int(delay / (time[1] - time[0]))
+        delay_time = np.linspace(0, delay, delay_samples, endpoint=False)
+        time = np.concatenate([delay_time, time + delay])
+        print("Using variable resolution sampling")
+
+    return time, delay
+
+
+def load_sweep_config(filename, kinetics, defaults):
+    """
+    Read a sweep config and return its parameter sets.
+
+    The sweep config is a JSON object mapping parameter names of the selected
+    kinetics (e.g. "A1", "tau_decay2"; time constants in ms) to a value or a list
+    of values. Lists are broadcast together; parameters that are not listed take
+    their values from defaults.
+
+    Parameters:
+    -----------
+    filename : str
+        Path of the JSON sweep config
+    kinetics : str
+        'fast' or 'slow'; selects the parameter names that may be swept
+    defaults : dict
+        Value of every parameter that is not listed in the config
+
+    Returns:
+    --------
+    values : dict
+        Parameter name -> 1-D float array, one entry per parameter set (all the same length)
+
+    Raises ValueError (or OSError if the file cannot be read) if the config is invalid.
+    """
+    if kinetics == 'fast':
+        names = ['A1', 'tau_rise1', 'tau_decay1', 'A2', 'tau_rise2', 'tau_decay2']
+    else:
+        names = ['A', 'tau_rise', 'tau_decay']
+
+    with open(filename) as f:
+        config = json.load(f)  # json.JSONDecodeError is a ValueError
+    if not isinstance(config, dict):
+        raise ValueError("must be a JSON object mapping parameter names to values")
+    unknown = sorted(set(config) - set(names))
+    if unknown:
+        raise ValueError(f"unknown {kinetics} kinetics parameter(s): {', '.join(unknown)} "
+                         f"(expected {', '.join(names)})")
+
+    columns = []
+    for n in names:
+        try:
+            column = np.atleast_1d(np.asarray(config.get(n, defaults[n]), dtype=float))
+        except (TypeError, ValueError):
+            raise ValueError(f"{n} must be a number or a list of numbers") from None
+        if column.ndim != 1 or column.size == 0:
+            raise ValueError(f"{n} must be a number or a non-empty, flat list of numbers")
+        if not np.all(np.isfinite(column)):
+            raise ValueError(f"{n} values must be finite numbers")
+        columns.append(column)
+    try:
+        columns = np.broadcast_arrays(*columns)
+    except ValueError:
+        lengths = ', '.join(f"{n}: {c.size}" for n, c in zip(names, columns) if c.size > 1)
+        raise ValueError(f"lists must all have the same length ({lengths})") from None
+    return dict(zip(names, columns))
+
+
+def run_sweep(args, values, time, time_stimulus, delay):
+    """
+    Generate one stimulus file per parameter set of a sweep.
+
+    values maps parameter names to equal-length arrays (time constants in ms), as
+    returned by load_sweep_config. All waveforms are computed in one batched call.
+    Each file name ends in the index of its parameter set (_set0, _set1, ...).
+    """
+    # One dict per parameter set (time constants stay in ms here)
+    n_sets = next(iter(values.values())).size
+    sweep = [{n: float(v[i]) for n, v in values.items()} for i in range(n_sets)]
+    print(f"Sweep: {len(sweep)} parameter sets from {args.sweep_config}")
+
+    # Convert tau parameters from ms to seconds
+    to_s = {n: (v / 1000 if n.startswith('tau') else v) for n, v in values.items()}
+    if args.kinetics == 'fast':
+        currents = batch_double_exponential(time_stimulus, **to_s)
+    else:
+        currents = batch_single_exponential(time_stimulus, **to_s)
+
+    # generate_filename truncates amplitudes to whole pA, so sets that differ only
+    # in the fraction would share a name; a set index keeps every file distinct
+    width = len(str(len(sweep) - 1))
+    for i, (params, current) in enumerate(zip(sweep, currents)):
+        base_filename = generate_filename(args.kinetics, args.sampling_rate, delay=delay, **params)
+        base_filename += f"_set{i:0{width}d}"
+        output_file = os.path.join(args.output_dir, base_filename + '.' + args.output_format)
+        write_trace(output_file, time, current, fmt=args.output_format,
+                    comment=args.comment, kinetics=args.kinetics,
+                    delay=delay, sampling_rate=args.sampling_rate, **params)
+
+    # Write command file for the whole sweep
+    sweep_name = os.path.splitext(os.path.basename(args.sweep_config))[0]
+    command_file = os.path.join(args.output_dir, sweep_name + '_command.txt')
+    with open(command_file, 'w') as f:
+        f.write(' '.join(sys.argv) + '\n')
+    print(f"Command file written: {command_file}")
+
+
 def main():
     """Main function to generate sim-EPSP stimulus file."""
     
@@ -399,76 +943,74 @@ def main():
                         help='Output filename (if not specified, auto-generates descriptive name)')
     parser.add_argument('--output_dir', type=str, default='output',
                         help='Output directory for generated files')
+    parser.add_argument('--output_format', type=str, default='atf', choices=['atf', 'h5'],
+                        help='Output file format: "atf" for Clampex, "h5" for HDF5 (requires h5py, not loadable by Clampex)')
     parser.add_argument('--plot', type=str, default=None,
                         help='Output plot filename (if not specified, auto-generates based on output filename)')
     parser.add_argument('--no_plot', action='store_true',
                         help='Skip generating plot')
+    parser.add_argument('--plot_dpi', type=float, default=120,
+                        help='Resolution of the saved plot (dots per inch); use 300 for publication quality')
     parser.add_argument('--comment', type=str, 
                         default='Simulated EPSP with fast-rising phase - Double exponential',
                         help='Comment for ATF file header')
+    parser.add_argument('--sweep_config', type=str, default=None,
+                        help='JSON file mapping parameter names to lists of values; writes one file per '
+                             'parameter set (auto-generated names, no plots)')
     
     args = parser.parse_args()
+
+    if not args.plot_dpi > 0:  # also rejects nan
+        parser.error(f"--plot_dpi must be positive, got {args.plot_dpi:g}")
+
+    # Sweep mode auto-names its files and writes no plots
+    if args.sweep_config is not None:
+        conflicting = [opt for opt, given in (('--output', args.output is not None),
+                                              ('--plot', args.plot is not None),
+                                              ('--plot_dpi', args.plot_dpi != parser.get_default('plot_dpi')))
+                       if given]
+        if conflicting:
+            parser.error(f"{', '.join(conflicting)} cannot be used with --sweep_config "
+                         "(sweep files are auto-named and not plotted)")
+        if args.no_plot:
+            print("Note: --no_plot is implied by --sweep_config")
+        try:
+            sweep_values = load_sweep_config(args.sweep_config, args.kinetics, vars(args))
+        except (OSError, ValueError) as e:
+            parser.error(f"--sweep_config {args.sweep_config}: {e}")
+
+    # Unless --comment is given, the file header describes the selected kinetics
+    if args.comment == parser.get_default('comment'):
+        args.comment = {'fast': "Fast-rising sim-EPSP - Double exponential",
+                        'slow': "Slow-rising sim-EPSP - Single exponential"}[args.kinetics]
     
-    # Create output directory if it doesn't exist
-    if not os.path.exists(args.output_dir):
+    # Create output directory if it doesn't exist (single mkdir, no check-then-create race)
+    try:
         os.makedirs(args.output_dir)
         print(f"Created output directory: {args.output_dir}")
+    except FileExistsError:
+        pass
     
     # parse units
 
     # Generate time array
-    if args.uniform_sampling:
-        # Uniform sampling interval (better for Clampex protocol setup)
-        dt = 1.0 / args.sampling_rate  # Sampling rate in Hz, dt in seconds
+    time, delay = precompute_time(args)
 
-        # Calculate delay
-        if args.auto_delay:
-            # Total sweep includes delay + stimulus duration
-            total_samples = int((args.delay + args.duration) / dt)
-            delay = (total_samples / 64) * dt
-            print(f"Auto-calculated delay: {delay:.6f} s ({delay*1000:.3f} ms)")
-        else:
-            delay = args.delay
-            print(f"Using specified delay: {delay:.6f} s ({delay*1000:.3f} ms)")
-
-        # Generate full time array (delay + stimulus)
-        total_duration = delay + args.duration
-        time = np.arange(0, total_duration, dt)
-        print(f"Using uniform sampling: {args.sampling_rate} Hz ({dt:.6f} s interval)")
-        print(f"Total duration: {total_duration:.6f} s (delay: {delay*1000:.3f} ms + stimulus: {args.duration*1000:.3f} ms)")
-    else:
-        # Variable resolution sampling (function generates time in ms, convert to s)
-        duration_ms = args.duration * 1000  # Convert duration from s to ms
-        time_ms = generate_time_array(
-            duration=duration_ms,
-            dt_fine=args.dt_fine,
-            dt_coarse=args.dt_coarse,
-            fine_duration=args.fine_duration
-        )
-        # Convert time from ms to seconds
-        time = time_ms / 1000
-
-        # Calculate delay for variable sampling
-        if args.auto_delay:
-            dt_avg = time[1] - time[0]  # Approximate dt
-            total_samples = len(time)
-            delay = (total_samples / 64) * dt_avg
-            print(f"Auto-calculated delay: {delay:.6f} s ({delay*1000:.3f} ms)")
-        else:
-            delay = args.delay
-            print(f"Using specified delay: {delay:.6f} s ({delay*1000:.3f} ms)")
-
-        # Add delay by prepending time points
-        delay_samples = int(delay / (time[1] - time[0]))
-        delay_time = np.linspace(0, delay, delay_samples, endpoint=False)
-        time = np.concatenate([delay_time, time + delay])
-        print("Using variable resolution sampling")
-    
     # Calculate current values based on kinetics type
     print(f"Kinetics type: {args.kinetics.upper()}")
 
-    # Create time array relative to stimulus start (subtract delay)
-    time_stimulus = time - delay
+    # Create time array relative to stimulus start (subtract delay).
+    # The waveform is evaluated in float32, which halves the memory traffic of
+    # the exp() calls. The subtraction is done in float64 before the cast:
+    # casting time and delay first would put an error of ulp(time) on every
+    # stimulus-relative time, which the fast rise (1/τrise1 ~ 1e5 /s) amplifies
+    # into visible changes in the '%g' output.
+    # The reference time column written to the ATF file stays in float64.
+    time_stimulus = (time - delay).astype(np.float32)
+
+    if args.sweep_config is not None:
+        run_sweep(args, sweep_values, time, time_stimulus, delay)
+        return
 
     if args.kinetics == 'fast':
         # Fast-rising: double-exponential
@@ -482,7 +1024,6 @@ def main():
             tau_rise2=args.tau_rise2 / 1000,
             tau_decay2=args.tau_decay2 / 1000
         )
-        comment = "Fast-rising sim-EPSP - Double exponential"
         
         # Generate filename if not specified
         if args.output is None:
@@ -493,7 +1034,7 @@ def main():
                 tau_rise1=args.tau_rise1, tau_rise2=args.tau_rise2,
                 tau_decay1=args.tau_decay1, tau_decay2=args.tau_decay2
             )
-            output_file = os.path.join(args.output_dir, base_filename + '.atf')
+            output_file = os.path.join(args.output_dir, base_filename + '.' + args.output_format)
         else:
             output_file = os.path.join(args.output_dir, args.output)
             base_filename = os.path.splitext(os.path.basename(args.output))[0]
@@ -507,7 +1048,6 @@ def main():
             tau_rise=args.tau_rise / 1000,
             tau_decay=args.tau_decay / 1000
         )
-        comment = "Slow-rising sim-EPSP - Single exponential"
         
         # Generate filename if not specified
         if args.output is None:
@@ -518,15 +1058,15 @@ def main():
                 tau_rise=args.tau_rise,
                 tau_decay=args.tau_decay
             )
-            output_file = os.path.join(args.output_dir, base_filename + '.atf')
+            output_file = os.path.join(args.output_dir, base_filename + '.' + args.output_format)
         else:
             output_file = os.path.join(args.output_dir, args.output)
             base_filename = os.path.splitext(os.path.basename(args.output))[0]
     
-    # Write ATF file
+    # Write stimulus file
     if args.kinetics == 'fast':
-        write_atf_file(output_file, time, current,
-                      comment=args.comment if args.comment != 'Simulated EPSP with fast-rising phase - Double exponential' else comment,
+        write_trace(output_file, time, current, fmt=args.output_format,
+                      comment=args.comment,
                       kinetics='fast',
                       A1=args.A1, A2=args.A2,
                       tau_rise1=args.tau_rise1, tau_decay1=args.tau_decay1,
@@ -534,8 +1074,8 @@ def main():
                       delay=delay,
                       sampling_rate=args.sampling_rate)
     else:
-        write_atf_file(output_file, time, current,
-                      comment=args.comment if args.comment != 'Simulated EPSP with fast-rising phase - Double exponential' else comment,
+        write_trace(output_file, time, current, fmt=args.output_format,
+                      comment=args.comment,
                       kinetics='slow',
                       A=args.A,
                       tau_rise=args.tau_rise, tau_decay=args.tau_decay,
@@ -546,7 +1086,6 @@ def main():
     command_file = os.path.join(args.output_dir, base_filename + '_command.txt')
     with open(command_file, 'w') as f:
         # Reconstruct the command from sys.argv
-        import sys
         command = ' '.join(sys.argv)
         f.write(command + '\n')
     print(f"Command file written: {command_file}")
@@ -564,13 +1103,15 @@ def main():
                 time, current, plot_filename,
                 title="Simulated EPSP - Fast-Rising (Double Exponential)",
                 A1=args.A1, tau_rise1=args.tau_rise1, tau_decay1=args.tau_decay1,
-                A2=args.A2, tau_rise2=args.tau_rise2, tau_decay2=args.tau_decay2
+                A2=args.A2, tau_rise2=args.tau_rise2, tau_decay2=args.tau_decay2,
+                dpi=args.plot_dpi
             )
         else:  # slow
             plot_stimulus(
                 time, current, plot_filename,
                 title="Simulated EPSP - Slow-Rising (Single Exponential)",
-                A=args.A, tau_rise=args.tau_rise, tau_decay=args.tau_decay
+                A=args.A, tau_rise=args.tau_rise, tau_decay=args.tau_decay,
+                dpi=args.plot_dpi
             )
     
     # Print summary
@@ -583,6 +1124,12 @@ def main():
         print(f"  Type: Slow-rising (single exponential)")
         print(f"  A = {args.A} pA, τrise = {args.tau_rise} ms, τdecay = {args.tau_decay} ms")
     
+    # Clampex can only load ATF files, so its setup only applies to ATF output
+    if args.output_format != 'atf':
+        print("\nNote: HDF5 output cannot be loaded by Clampex; "
+              "use --output_format atf to create a stimulus file")
+        return
+
     # Print Clampex configuration instructions
     print("\n" + "="*70)
     print("CLAMPEX PROTOCOL CONFIGURATION")